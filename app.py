@@ -3,24 +3,79 @@ Real Estate CRM - Flask Application
 A comprehensive CRM system for managing properties, clients, and deals
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, has_request_context, make_response, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.ext.hybrid import hybrid_property
+from werkzeug.security import check_password_hash
+from jinja2 import FileSystemBytecodeCache
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from datetime import date, datetime, timedelta
+from functools import wraps
+import atexit
+import calendar
+import hashlib
 import os
+import queue
+import random
+import sqlite3
+import threading
+import time
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24).hex()
+# Set SECRET_KEY in production: every process must share it, otherwise sessions
+# signed by one worker are rejected by the others and users get logged out.
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or os.urandom(24).hex()
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///real_estate_crm.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+PER_PAGE = 50  # rows per page on list views
+STAFF_PER_PAGE = 25  # staff cards per page
+
 db = SQLAlchemy(app)
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL journaling and a larger page cache for every SQLite connection"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA cache_size=-65536')  # 64 MB
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')  # 256 MB
+    cursor.close()
+
+
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+# argon2id at OWASP's minimum recommended settings (2 passes, 19 MiB, 1 lane).
+# This is a deliberate downgrade from argon2-cffi's default, RFC 9106's
+# low-memory profile (3 passes, 64 MiB, 4 lanes), so that hashing is cheap
+# enough to run in the request thread. Hashes made with the RFC profile are
+# rewritten with these weaker settings on the user's next login.
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+# Compiled templates are shared between worker processes through an on-disk
+# bytecode cache and loaded up front, so no request pays to compile one.
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+for template_name in app.jinja_env.list_templates():
+    app.jinja_env.get_template(template_name)
+
 # ============== Database Models ==============
 
+# Row timestamps are generated by SQLite inside the INSERT/UPDATE statement
+# instead of being computed in Python and sent as a parameter (UTC, ms precision)
+UTC_NOW = db.func.strftime('%Y-%m-%d %H:%M:%f', 'now')
+
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -35,7 +90,7 @@ class User(UserMixin, db.Model):
     commission_rate = db.Column(db.Float, default=3.0)
     is_active = db.Column(db.Boolean, default=True)
     avatar_color = db.Column(db.String(20), default='#1a365d')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=UTC_NOW)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     
     # Relationships
@@ -44,17 +99,36 @@ class User(UserMixin, db.Model):
     tasks = db.relationship('Task', backref='assigned_to', lazy=True, foreign_keys='Task.user_id')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-    
-    @property
+        # Accounts created before the switch to argon2 still hold Werkzeug hashes
+        if not self.password_hash.startswith('$argon2'):
+            return check_password_hash(self.password_hash, password)
+        try:
+            return password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    
+    def password_needs_rehash(self):
+        """True for legacy Werkzeug hashes and argon2 hashes with outdated parameters"""
+        return (not self.password_hash.startswith('$argon2')
+                or password_hasher.check_needs_rehash(self.password_hash))
+    
+    @hybrid_property
     def full_name(self):
         if self.first_name and self.last_name:
             return f"{self.first_name} {self.last_name}"
         return self.username
     
+    @full_name.expression
+    def full_name(cls):
+        return db.case(
+            (db.and_(db.func.coalesce(cls.first_name, '') != '', db.func.coalesce(cls.last_name, '') != ''),
+             cls.first_name + ' ' + cls.last_name),
+            else_=cls.username
+        )
+    
     def is_admin(self):
         return self.role == 'admin'
     
@@ -75,17 +149,28 @@ class Client(db.Model):
     preferred_location = db.Column(db.String(200))
     notes = db.Column(db.Text)
     source = db.Column(db.String(50))  # referral, website, social, etc.
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=UTC_NOW)
+    updated_at = db.Column(db.DateTime, default=UTC_NOW, onupdate=UTC_NOW)
     agent_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    
+
+    __table_args__ = (
+        db.Index('ix_client_agent_created', 'agent_id', 'created_at'),
+        db.Index('ix_client_agent_status', 'agent_id', 'status'),
+        # Covers the reports page's lead-source breakdown
+        db.Index('ix_client_agent_source', 'agent_id', 'source', sqlite_where=source.isnot(None)),
+    )
+
     # Relationships
     interactions = db.relationship('Interaction', backref='client', lazy=True, cascade='all, delete-orphan')
     deals = db.relationship('Deal', backref='client', lazy=True)
 
-    @property
+    @hybrid_property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
+    
+    @full_name.expression
+    def full_name(cls):
+        return cls.first_name + ' ' + cls.last_name
 
 
 class Property(db.Model):
@@ -107,10 +192,17 @@ class Property(db.Model):
     description = db.Column(db.Text)
     features = db.Column(db.Text)  # JSON string of features
     image_url = db.Column(db.String(500))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=UTC_NOW)
+    updated_at = db.Column(db.DateTime, default=UTC_NOW, onupdate=UTC_NOW)
     agent_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    
+
+    __table_args__ = (
+        db.Index('ix_property_agent_created', 'agent_id', 'created_at'),
+        db.Index('ix_property_agent_status', 'agent_id', 'status'),
+        db.Index('ix_property_agent_type', 'agent_id', 'property_type'),
+        db.Index('ix_property_agent_listing', 'agent_id', 'listing_type'),
+    )
+
     # Relationships
     deals = db.relationship('Deal', backref='property', lazy=True)
     showings = db.relationship('Showing', backref='property', lazy=True, cascade='all, delete-orphan')
@@ -126,14 +218,33 @@ class Deal(db.Model):
     commission_rate = db.Column(db.Float, default=3.0)
     closing_date = db.Column(db.Date)
     notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=UTC_NOW)
+    updated_at = db.Column(db.DateTime, default=UTC_NOW, onupdate=UTC_NOW)
+
+    __table_args__ = (
+        db.Index('ix_deal_client_status', 'client_id', 'status'),
+        db.Index('ix_deal_property', 'property_id'),
+        # Only closed deals, for the closing-date ranges on the reports and staff pages
+        db.Index('ix_deal_closed', 'client_id', 'closing_date', sqlite_where=status == 'closed'),
+    )
 
-    @property
+    @hybrid_property
+    def sale_price(self):
+        return self.final_price or self.offer_price or 0
+
+    @sale_price.expression
+    def sale_price(cls):
+        return db.func.coalesce(db.func.nullif(cls.final_price, 0), db.func.nullif(cls.offer_price, 0), 0)
+
+    @hybrid_property
     def commission_amount(self):
-        price = self.final_price or self.offer_price or 0
+        price = self.sale_price
         return price * (self.commission_rate / 100) if price else 0
 
+    @commission_amount.expression
+    def commission_amount(cls):
+        return cls.sale_price * cls.commission_rate / 100.0
+
 
 class Interaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -141,7 +252,11 @@ class Interaction(db.Model):
     interaction_type = db.Column(db.String(30))  # call, email, meeting, showing, note
     subject = db.Column(db.String(200))
     notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=UTC_NOW)
+
+    __table_args__ = (
+        db.Index('ix_interaction_client_created', 'client_id', 'created_at'),
+    )
 
 
 class Task(db.Model):
@@ -153,7 +268,14 @@ class Task(db.Model):
     due_date = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=UTC_NOW)
+
+    __table_args__ = (
+        db.Index('ix_task_user_due', 'user_id', 'due_date'),
+        db.Index('ix_task_user_status', 'user_id', 'status'),
+        # Only open tasks, for the dashboard's upcoming list
+        db.Index('ix_task_open', 'user_id', 'due_date', sqlite_where=status != 'completed'),
+    )
 
 
 class Showing(db.Model):
@@ -165,7 +287,36 @@ class Showing(db.Model):
     scheduled_date = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.String(20), default='scheduled')  # scheduled, completed, cancelled, no_show
     feedback = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=UTC_NOW)
+
+    __table_args__ = (
+        db.Index('ix_showing_property_scheduled', 'property_id', 'scheduled_date', 'status'),
+        # Only scheduled showings, for the dashboard's upcoming list
+        db.Index('ix_showing_upcoming', 'property_id', 'scheduled_date', sqlite_where=status == 'scheduled'),
+    )
+
+
+ACTION_ICONS = {
+    'created': 'fa-plus-circle',
+    'updated': 'fa-edit',
+    'deleted': 'fa-trash',
+    'viewed': 'fa-eye',
+    'login': 'fa-sign-in-alt',
+    'logout': 'fa-sign-out-alt',
+    'status_change': 'fa-exchange-alt',
+    'scheduled': 'fa-calendar-plus'
+}
+
+ACTION_COLORS = {
+    'created': 'success',
+    'updated': 'info',
+    'deleted': 'danger',
+    'viewed': 'primary',
+    'login': 'success',
+    'logout': 'warning',
+    'status_change': 'info',
+    'scheduled': 'primary'
+}
 
 
 class Activity(db.Model):
@@ -178,61 +329,249 @@ class Activity(db.Model):
     entity_name = db.Column(db.String(200))  # Store name for display even if entity is deleted
     details = db.Column(db.Text)  # Additional details in JSON format
     ip_address = db.Column(db.String(50))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
+    created_at = db.Column(db.DateTime, default=UTC_NOW)
+
+    __table_args__ = (
+        db.Index('ix_activity_user_created', 'user_id', 'created_at'),
+        db.Index('ix_activity_created', 'created_at'),
+    )
+
     # Relationship
     user = db.relationship('User', backref='activities', lazy=True)
     
     @property
     def action_icon(self):
-        icons = {
-            'created': 'fa-plus-circle',
-            'updated': 'fa-edit',
-            'deleted': 'fa-trash',
-            'viewed': 'fa-eye',
-            'login': 'fa-sign-in-alt',
-            'logout': 'fa-sign-out-alt',
-            'status_change': 'fa-exchange-alt',
-            'scheduled': 'fa-calendar-plus'
-        }
-        return icons.get(self.action, 'fa-circle')
+        return ACTION_ICONS.get(self.action, 'fa-circle')
     
     @property
     def action_color(self):
-        colors = {
-            'created': 'success',
-            'updated': 'info',
-            'deleted': 'danger',
-            'viewed': 'primary',
-            'login': 'success',
-            'logout': 'warning',
-            'status_change': 'info',
-            'scheduled': 'primary'
-        }
-        return colors.get(self.action, 'primary')
+        return ACTION_COLORS.get(self.action, 'primary')
+
+
+# Activities are written by a background thread in batches, so a request
+# never pays for an extra commit just to record what it did. Each process
+# starts its own writer on first use; threads don't survive a fork, so
+# workers forked from a preloaded app get a fresh queue and writer.
+ACTIVITY_BATCH_SIZE = 500
+ACTIVITY_FLUSH_INTERVAL = 1.0  # seconds
+
+activity_queue = queue.Queue()
+activity_writer_lock = threading.Lock()
+activity_writer_thread = None
+
+
+def write_activities(batch):
+    """Insert a batch of queued activities with one multi-row INSERT"""
+    with app.app_context():
+        db.session.execute(db.insert(Activity), batch)
+        db.session.commit()
+
+
+def activity_writer():
+    """Drain the activity queue, committing up to ACTIVITY_BATCH_SIZE rows at a time"""
+    while True:
+        batch = [activity_queue.get()]
+        deadline = time.monotonic() + ACTIVITY_FLUSH_INTERVAL
+        while len(batch) < ACTIVITY_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(activity_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            write_activities(batch)
+        except Exception:
+            app.logger.exception('Failed to write %d activities', len(batch))
+        finally:
+            for _ in batch:
+                activity_queue.task_done()
+
+
+def start_activity_writer():
+    """Start this process's writer thread unless it is already running"""
+    global activity_writer_thread
+    with activity_writer_lock:
+        if activity_writer_thread is None or not activity_writer_thread.is_alive():
+            activity_writer_thread = threading.Thread(target=activity_writer, name='activity-writer', daemon=True)
+            activity_writer_thread.start()
+
+
+def reset_activity_writer():
+    """Give a forked child its own queue; the parent's writer stays with the parent"""
+    global activity_queue, activity_writer_lock, activity_writer_thread
+    activity_queue = queue.Queue()
+    activity_writer_lock = threading.Lock()
+    activity_writer_thread = None
+
+
+def flush_activities():
+    """Block until every queued activity has been written"""
+    # Without a running writer nothing would ever drain the queue
+    if activity_writer_thread is not None and activity_writer_thread.is_alive():
+        activity_queue.join()
+
+
+os.register_at_fork(after_in_child=reset_activity_writer)
+atexit.register(flush_activities)
 
 
 def log_activity(action, entity_type=None, entity_id=None, entity_name=None, details=None):
-    """Helper function to log user activities"""
+    """Helper function to log user activities
+
+    The entry is held on the session and handed to the background writer
+    only if the caller's transaction commits; it is dropped on rollback. The
+    writer inserts it later in its own transaction, so an entry can still be
+    lost after the change it describes has been committed.
+    """
     if current_user.is_authenticated:
-        activity = Activity(
-            user_id=current_user.id,
-            action=action,
-            entity_type=entity_type,
-            entity_id=entity_id,
-            entity_name=entity_name,
-            details=details,
-            ip_address=request.remote_addr if request else None
-        )
-        db.session.add(activity)
-        db.session.commit()
+        db.session.info.setdefault('pending_activities', []).append({
+            'user_id': current_user.id,
+            'action': action,
+            'entity_type': entity_type,
+            'entity_id': entity_id,
+            'entity_name': entity_name,
+            'details': details,
+            'ip_address': request.remote_addr if request else None,
+            'created_at': datetime.utcnow()
+        })
+
+
+@event.listens_for(Session, 'after_commit')
+def queue_pending_activities(session):
+    pending = session.info.pop('pending_activities', None)
+    if pending:
+        start_activity_writer()
+        for entry in pending:
+            activity_queue.put(entry)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_pending_activities(session):
+    session.info.pop('pending_activities', None)
+
+
+# ============== Full-Text Search ==============
+
+# SQLite FTS5 indexes mirroring the searchable columns of each table. They are
+# external-content tables, so only the index is stored and triggers keep it in
+# sync with the base table.
+FTS_TABLES = {
+    'client': ('first_name', 'last_name', 'email', 'phone'),
+    'property': ('title', 'address', 'city'),
+}
+
+
+def create_fts_tables():
+    """Create missing FTS5 indexes and their sync triggers, then populate them"""
+    for table, columns in FTS_TABLES.items():
+        fts = f'{table}_fts'
+        if db.session.execute(db.text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': fts}).first():
+            continue
+        
+        cols = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        insert_new = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values});"
+        delete_old = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});"
+        for statement in (
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id')",
+            f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert_new} END",
+            f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete_old} END",
+            f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN {delete_old} {insert_new} END",
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ):
+            db.session.execute(db.text(statement))
+    db.session.commit()
+
+
+def fts_search(table, search):
+    """Subquery of ids in `table` where every search term prefixes an indexed word"""
+    terms = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in search.split())
+    return db.text(f"SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH :terms")\
+        .bindparams(terms=terms).columns(rowid=db.Integer)
 
 
 # ============== Login Manager ==============
 
+# Column snapshots of recently loaded users, keyed by id, so authenticated
+# requests don't need a SELECT to restore current_user. forget_user() only
+# evicts from the worker that made the change, so other workers can serve a
+# stale snapshot for up to USER_CACHE_TTL: an edited or deleted user stays
+# logged in with the old details until it expires there. admin_required and
+# manager_required re-read the user from the database, so a revoked role or
+# a deleted account never passes them.
+USER_CACHE_TTL = 10  # seconds
+
+user_cache = {}
+
+# Ids and display names of all users for the activity log's staff filter.
+STAFF_OPTIONS_TTL = 60  # seconds
+
+staff_options_cache = {}
+
+
+def forget_user(user_id):
+    """Drop cached copies of a user after their record is added or changed"""
+    user_cache.pop(user_id, None)
+    staff_options_cache.clear()
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    cached = user_cache.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        user = User(**cached[1])
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    
+    user = db.session.get(User, user_id)
+    if user:
+        snapshot = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+        user_cache[user_id] = (time.monotonic() + USER_CACHE_TTL, snapshot)
+    return user
+
+
+# ============== Conditional GET ==============
+
+def source_version():
+    """Digest of the app and template sources, identical in every worker of a deploy"""
+    digest = hashlib.sha1()
+    with open(__file__, 'rb') as source:
+        digest.update(source.read())
+    for template_name in sorted(app.jinja_env.list_templates()):
+        template_source = app.jinja_env.loader.get_source(app.jinja_env, template_name)[0]
+        digest.update(template_name.encode())
+        digest.update(template_source.encode())
+    return digest.hexdigest()
+
+
+# Part of every ETag, so a deploy that changes the markup makes browsers
+# fetch the new page instead of revalidating the old one
+SOURCE_VERSION = source_version()
+
+
+def page_etag(*versions):
+    """ETag for a page from the values that determine its content"""
+    key = repr((SOURCE_VERSION, current_user.id, current_user.full_name, current_user.role) + versions)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def render_conditional(etag, render):
+    """Return 304 if the browser already holds this version of the page, else render it"""
+    if '_flashes' in session:
+        # Flash messages are one-off, so a page showing them must not be revalidated later
+        return render()
+    
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 # ============== Routes ==============
@@ -255,16 +594,12 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         if user and user.check_password(password):
+            # Upgrade the stored hash while the plain password is at hand
+            if user.password_needs_rehash():
+                user.set_password(password)
+                forget_user(user.id)
             login_user(user)
-            # Log login activity
-            activity = Activity(
-                user_id=user.id,
-                action='login',
-                entity_type='session',
-                entity_name=f'{user.full_name} logged in',
-                ip_address=request.remote_addr
-            )
-            db.session.add(activity)
+            log_activity('login', 'session', entity_name=f'{user.full_name} logged in')
             db.session.commit()
             flash('Welcome back!', 'success')
             return redirect(url_for('dashboard'))
@@ -277,49 +612,86 @@ def login():
 @login_required
 def logout():
     log_activity('logout', 'session', entity_name=f'{current_user.full_name} logged out')
+    db.session.commit()
     logout_user()
     flash('You have been logged out.', 'info')
     return redirect(url_for('login'))
 
 
+# Template context of the dashboard and reports pages per user. Any commit made
+# by a user drops their entries, so the caches only save work on repeat views
+# between changes.
+DASHBOARD_CACHE_TTL = 60  # seconds
+REPORTS_CACHE_TTL = 300  # seconds
+
+dashboard_cache = {}
+reports_cache = {}
+
+
+@event.listens_for(Session, 'after_commit')
+def forget_cached_pages(session):
+    if has_request_context() and current_user.is_authenticated:
+        dashboard_cache.pop(current_user.id, None)
+        reports_cache.pop(current_user.id, None)
+
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    # Get statistics
-    total_clients = Client.query.filter_by(agent_id=current_user.id).count()
-    total_properties = Property.query.filter_by(agent_id=current_user.id).count()
-    active_deals = Deal.query.join(Client).filter(
-        Client.agent_id == current_user.id,
-        Deal.status.in_(['initiated', 'negotiation', 'under_contract'])
-    ).count()
+    cached = dashboard_cache.get(current_user.id)
+    if cached and cached[0] > time.monotonic():
+        return render_template('dashboard.html', **cached[1])
+    
+    # Get statistics in a single round-trip. The statement is built once and
+    # reused, with the user id as its only parameter.
+    user_id = current_user.id
+    total_clients, total_properties, active_deals, total_revenue = db.session.execute(db.lambda_stmt(
+        lambda: db.select(
+            db.select(db.func.count(Client.id))
+                .where(Client.agent_id == user_id).scalar_subquery(),
+            db.select(db.func.count(Property.id))
+                .where(Property.agent_id == user_id).scalar_subquery(),
+            db.select(db.func.count(Deal.id)).join(Client).where(
+                Client.agent_id == user_id,
+                Deal.status.in_(['initiated', 'negotiation', 'under_contract'])
+            ).scalar_subquery(),
+            # Total revenue from closed deals
+            db.select(db.func.coalesce(db.func.sum(Deal.commission_amount), 0)).join(Client).where(
+                Client.agent_id == user_id,
+                Deal.status == 'closed'
+            ).scalar_subquery()
+        )
+    )).one()
     
-    # Calculate total revenue from closed deals
-    closed_deals = Deal.query.join(Client).filter(
-        Client.agent_id == current_user.id,
-        Deal.status == 'closed'
-    ).all()
-    total_revenue = sum(deal.commission_amount for deal in closed_deals)
+    # The lists select only the columns the dashboard shows. They are cached
+    # across requests, so they must be plain rows, not session-bound ORM objects.
     
     # Recent activities
-    recent_clients = Client.query.filter_by(agent_id=current_user.id)\
-        .order_by(Client.created_at.desc()).limit(5).all()
-    recent_properties = Property.query.filter_by(agent_id=current_user.id)\
-        .order_by(Property.created_at.desc()).limit(5).all()
+    recent_clients = db.session.execute(db.select(
+        Client.id, Client.full_name.label('full_name'), Client.email, Client.client_type, Client.status
+    ).where(Client.agent_id == current_user.id).order_by(Client.created_at.desc()).limit(5)).all()
+    recent_properties = db.session.execute(db.select(
+        Property.id, Property.title, Property.city, Property.address, Property.price, Property.status
+    ).where(Property.agent_id == current_user.id).order_by(Property.created_at.desc()).limit(5)).all()
     
     # Upcoming tasks
-    upcoming_tasks = Task.query.filter(
+    upcoming_tasks = db.session.execute(db.select(
+        Task.title, Task.priority, Task.due_date
+    ).where(
         Task.user_id == current_user.id,
         Task.status != 'completed'
-    ).order_by(Task.due_date).limit(5).all()
+    ).order_by(Task.due_date).limit(5)).all()
     
     # Upcoming showings
-    upcoming_showings = Showing.query.join(Property).filter(
+    upcoming_showings = db.session.execute(db.select(
+        Property.title.label('property_title'), Showing.client_name, Showing.scheduled_date
+    ).select_from(Showing).join(Property).where(
         Property.agent_id == current_user.id,
         Showing.scheduled_date >= datetime.utcnow(),
         Showing.status == 'scheduled'
-    ).order_by(Showing.scheduled_date).limit(5).all()
+    ).order_by(Showing.scheduled_date).limit(5)).all()
     
-    return render_template('dashboard.html',
+    context = dict(
         total_clients=total_clients,
         total_properties=total_properties,
         active_deals=active_deals,
@@ -329,6 +701,9 @@ def dashboard():
         upcoming_tasks=upcoming_tasks,
         upcoming_showings=upcoming_showings
     )
+    dashboard_cache[current_user.id] = (time.monotonic() + DASHBOARD_CACHE_TTL, context)
+    
+    return render_template('dashboard.html', **context)
 
 
 # ============== Client Routes ==============
@@ -338,26 +713,22 @@ def dashboard():
 def clients():
     status_filter = request.args.get('status', '')
     type_filter = request.args.get('type', '')
-    search = request.args.get('search', '')
-    
-    query = Client.query.filter_by(agent_id=current_user.id)
+    search = request.args.get('search', '').strip()
     
+    conditions = [Client.agent_id == current_user.id]
     if status_filter:
-        query = query.filter_by(status=status_filter)
+        conditions.append(Client.status == status_filter)
     if type_filter:
-        query = query.filter_by(client_type=type_filter)
+        conditions.append(Client.client_type == type_filter)
     if search:
-        query = query.filter(
-            db.or_(
-                Client.first_name.ilike(f'%{search}%'),
-                Client.last_name.ilike(f'%{search}%'),
-                Client.email.ilike(f'%{search}%'),
-                Client.phone.ilike(f'%{search}%')
-            )
-        )
+        conditions.append(Client.id.in_(fts_search('client', search)))
     
-    clients = query.order_by(Client.created_at.desc()).all()
-    return render_template('clients.html', clients=clients)
+    page = request.args.get('page', 1, type=int)
+    pagination = db.paginate(
+        db.select(Client).where(*conditions).order_by(Client.created_at.desc()),
+        page=page, per_page=PER_PAGE, error_out=False
+    )
+    return render_template('clients.html', clients=pagination.items, pagination=pagination)
 
 
 @app.route('/clients/add', methods=['GET', 'POST'])
@@ -379,8 +750,9 @@ def add_client():
             agent_id=current_user.id
         )
         db.session.add(client)
-        db.session.commit()
+        db.session.flush()
         log_activity('created', 'client', client.id, client.full_name, f'Added new client: {client.full_name}')
+        db.session.commit()
         flash('Client added successfully!', 'success')
         return redirect(url_for('clients'))
     
@@ -390,23 +762,33 @@ def add_client():
 @app.route('/clients/<int:id>')
 @login_required
 def view_client(id):
-    client = Client.query.get_or_404(id)
+    client = db.get_or_404(Client, id)
     if client.agent_id != current_user.id:
         flash('Access denied', 'error')
         return redirect(url_for('clients'))
     
-    interactions = Interaction.query.filter_by(client_id=id)\
-        .order_by(Interaction.created_at.desc()).all()
-    deals = Deal.query.filter_by(client_id=id).all()
+    etag = page_etag(client.updated_at, *db.session.execute(db.select(
+        db.select(db.func.count(Interaction.id)).where(Interaction.client_id == id).scalar_subquery(),
+        db.select(db.func.max(Interaction.created_at)).where(Interaction.client_id == id).scalar_subquery(),
+        db.select(db.func.count(Deal.id)).where(Deal.client_id == id).scalar_subquery(),
+        db.select(db.func.max(Deal.updated_at)).where(Deal.client_id == id).scalar_subquery(),
+        db.select(db.func.max(Property.updated_at)).join(Deal).where(Deal.client_id == id).scalar_subquery()
+    )).one())
     
-    return render_template('client_detail.html', client=client, 
-                         interactions=interactions, deals=deals)
+    def render():
+        interactions = Interaction.query.filter_by(client_id=id)\
+            .order_by(Interaction.created_at.desc()).all()
+        deals = Deal.query.options(db.joinedload(Deal.property)).filter_by(client_id=id).all()
+        return render_template('client_detail.html', client=client, 
+                             interactions=interactions, deals=deals)
+    
+    return render_conditional(etag, render)
 
 
 @app.route('/clients/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_client(id):
-    client = Client.query.get_or_404(id)
+    client = db.get_or_404(Client, id)
     if client.agent_id != current_user.id:
         flash('Access denied', 'error')
         return redirect(url_for('clients'))
@@ -423,8 +805,8 @@ def edit_client(id):
         client.preferred_location = request.form.get('preferred_location')
         client.source = request.form.get('source')
         client.notes = request.form.get('notes')
-        db.session.commit()
         log_activity('updated', 'client', client.id, client.full_name, f'Updated client: {client.full_name}')
+        db.session.commit()
         flash('Client updated successfully!', 'success')
         return redirect(url_for('view_client', id=id))
     
@@ -434,15 +816,15 @@ def edit_client(id):
 @app.route('/clients/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_client(id):
-    client = Client.query.get_or_404(id)
+    client = db.get_or_404(Client, id)
     if client.agent_id != current_user.id:
         flash('Access denied', 'error')
         return redirect(url_for('clients'))
     
     client_name = client.full_name
     db.session.delete(client)
-    db.session.commit()
     log_activity('deleted', 'client', id, client_name, f'Deleted client: {client_name}')
+    db.session.commit()
     flash('Client deleted successfully!', 'success')
     return redirect(url_for('clients'))
 
@@ -450,7 +832,7 @@ def delete_client(id):
 @app.route('/clients/<int:id>/interaction', methods=['POST'])
 @login_required
 def add_interaction(id):
-    client = Client.query.get_or_404(id)
+    client = db.get_or_404(Client, id)
     if client.agent_id != current_user.id:
         return jsonify({'error': 'Access denied'}), 403
     
@@ -474,27 +856,24 @@ def properties():
     status_filter = request.args.get('status', '')
     type_filter = request.args.get('type', '')
     listing_filter = request.args.get('listing', '')
-    search = request.args.get('search', '')
-    
-    query = Property.query.filter_by(agent_id=current_user.id)
+    search = request.args.get('search', '').strip()
     
+    conditions = [Property.agent_id == current_user.id]
     if status_filter:
-        query = query.filter_by(status=status_filter)
+        conditions.append(Property.status == status_filter)
     if type_filter:
-        query = query.filter_by(property_type=type_filter)
+        conditions.append(Property.property_type == type_filter)
     if listing_filter:
-        query = query.filter_by(listing_type=listing_filter)
+        conditions.append(Property.listing_type == listing_filter)
     if search:
-        query = query.filter(
-            db.or_(
-                Property.title.ilike(f'%{search}%'),
-                Property.address.ilike(f'%{search}%'),
-                Property.city.ilike(f'%{search}%')
-            )
-        )
+        conditions.append(Property.id.in_(fts_search('property', search)))
     
-    properties = query.order_by(Property.created_at.desc()).all()
-    return render_template('properties.html', properties=properties)
+    page = request.args.get('page', 1, type=int)
+    pagination = db.paginate(
+        db.select(Property).where(*conditions).order_by(Property.created_at.desc()),
+        page=page, per_page=PER_PAGE, error_out=False
+    )
+    return render_template('properties.html', properties=pagination.items, pagination=pagination)
 
 
 @app.route('/properties/add', methods=['GET', 'POST'])
@@ -522,8 +901,9 @@ def add_property():
             agent_id=current_user.id
         )
         db.session.add(prop)
-        db.session.commit()
+        db.session.flush()
         log_activity('created', 'property', prop.id, prop.title, f'Added property: {prop.title} - ${prop.price:,.0f}')
+        db.session.commit()
         flash('Property added successfully!', 'success')
         return redirect(url_for('properties'))
     
@@ -533,23 +913,33 @@ def add_property():
 @app.route('/properties/<int:id>')
 @login_required
 def view_property(id):
-    prop = Property.query.get_or_404(id)
+    prop = db.get_or_404(Property, id)
     if prop.agent_id != current_user.id:
         flash('Access denied', 'error')
         return redirect(url_for('properties'))
     
-    showings = Showing.query.filter_by(property_id=id)\
-        .order_by(Showing.scheduled_date.desc()).all()
-    deals = Deal.query.filter_by(property_id=id).all()
+    etag = page_etag(prop.updated_at, *db.session.execute(db.select(
+        db.select(db.func.count(Showing.id)).where(Showing.property_id == id).scalar_subquery(),
+        db.select(db.func.max(Showing.created_at)).where(Showing.property_id == id).scalar_subquery(),
+        db.select(db.func.count(Deal.id)).where(Deal.property_id == id).scalar_subquery(),
+        db.select(db.func.max(Deal.updated_at)).where(Deal.property_id == id).scalar_subquery(),
+        db.select(db.func.max(Client.updated_at)).join(Deal).where(Deal.property_id == id).scalar_subquery()
+    )).one())
     
-    return render_template('property_detail.html', property=prop, 
-                         showings=showings, deals=deals)
+    def render():
+        showings = Showing.query.filter_by(property_id=id)\
+            .order_by(Showing.scheduled_date.desc()).all()
+        deals = Deal.query.options(db.joinedload(Deal.client)).filter_by(property_id=id).all()
+        return render_template('property_detail.html', property=prop, 
+                             showings=showings, deals=deals)
+    
+    return render_conditional(etag, render)
 
 
 @app.route('/properties/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_property(id):
-    prop = Property.query.get_or_404(id)
+    prop = db.get_or_404(Property, id)
     if prop.agent_id != current_user.id:
         flash('Access denied', 'error')
         return redirect(url_for('properties'))
@@ -572,8 +962,8 @@ def edit_property(id):
         prop.description = request.form.get('description')
         prop.features = request.form.get('features')
         prop.image_url = request.form.get('image_url')
-        db.session.commit()
         log_activity('updated', 'property', prop.id, prop.title, f'Updated property: {prop.title}')
+        db.session.commit()
         flash('Property updated successfully!', 'success')
         return redirect(url_for('view_property', id=id))
     
@@ -583,15 +973,15 @@ def edit_property(id):
 @app.route('/properties/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_property(id):
-    prop = Property.query.get_or_404(id)
+    prop = db.get_or_404(Property, id)
     if prop.agent_id != current_user.id:
         flash('Access denied', 'error')
         return redirect(url_for('properties'))
     
     prop_title = prop.title
     db.session.delete(prop)
-    db.session.commit()
     log_activity('deleted', 'property', id, prop_title, f'Deleted property: {prop_title}')
+    db.session.commit()
     flash('Property deleted successfully!', 'success')
     return redirect(url_for('properties'))
 
@@ -599,7 +989,7 @@ def delete_property(id):
 @app.route('/properties/<int:id>/showing', methods=['POST'])
 @login_required
 def add_showing(id):
-    prop = Property.query.get_or_404(id)
+    prop = db.get_or_404(Property, id)
     if prop.agent_id != current_user.id:
         return jsonify({'error': 'Access denied'}), 403
     
@@ -608,12 +998,13 @@ def add_showing(id):
         client_name=request.form.get('client_name'),
         client_phone=request.form.get('client_phone'),
         client_email=request.form.get('client_email'),
-        scheduled_date=datetime.strptime(request.form.get('scheduled_date'), '%Y-%m-%dT%H:%M'),
+        scheduled_date=datetime.fromisoformat(request.form.get('scheduled_date')),
         status='scheduled'
     )
     db.session.add(showing)
-    db.session.commit()
+    db.session.flush()
     log_activity('scheduled', 'showing', showing.id, prop.title, f'Scheduled showing for {prop.title} with {showing.client_name}')
+    db.session.commit()
     flash('Showing scheduled!', 'success')
     return redirect(url_for('view_property', id=id))
 
@@ -625,13 +1016,24 @@ def add_showing(id):
 def deals():
     status_filter = request.args.get('status', '')
     
-    query = Deal.query.join(Client).filter(Client.agent_id == current_user.id)
-    
+    conditions = [Client.agent_id == current_user.id]
     if status_filter:
-        query = query.filter(Deal.status == status_filter)
-    
-    deals = query.order_by(Deal.created_at.desc()).all()
-    return render_template('deals.html', deals=deals)
+        conditions.append(Deal.status == status_filter)
+    
+    # Pipeline totals cover every matching deal, not just the current page
+    status_counts = dict(db.session.execute(
+        db.select(Deal.status, db.func.count(Deal.id)).join(Client).where(*conditions).group_by(Deal.status)
+    ).all())
+    
+    page = request.args.get('page', 1, type=int)
+    pagination = db.paginate(
+        db.select(Deal).join(Client).options(
+            db.contains_eager(Deal.client),
+            db.joinedload(Deal.property)
+        ).where(*conditions).order_by(Deal.created_at.desc()),
+        page=page, per_page=PER_PAGE, error_out=False
+    )
+    return render_template('deals.html', deals=pagination.items, pagination=pagination, status_counts=status_counts)
 
 
 @app.route('/deals/add', methods=['GET', 'POST'])
@@ -646,12 +1048,13 @@ def add_deal():
             offer_price=float(request.form.get('offer_price') or 0),
             final_price=float(request.form.get('final_price') or 0) if request.form.get('final_price') else None,
             commission_rate=float(request.form.get('commission_rate') or 3.0),
-            closing_date=datetime.strptime(closing_date, '%Y-%m-%d').date() if closing_date else None,
+            closing_date=date.fromisoformat(closing_date) if closing_date else None,
             notes=request.form.get('notes')
         )
         db.session.add(deal)
-        db.session.commit()
+        db.session.flush()
         log_activity('created', 'deal', deal.id, deal.property.title, f'Created deal for {deal.property.title} with {deal.client.full_name}')
+        db.session.commit()
         flash('Deal created successfully!', 'success')
         return redirect(url_for('deals'))
     
@@ -663,7 +1066,7 @@ def add_deal():
 @app.route('/deals/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_deal(id):
-    deal = Deal.query.get_or_404(id)
+    deal = db.get_or_404(Deal, id)
     if deal.client.agent_id != current_user.id:
         flash('Access denied', 'error')
         return redirect(url_for('deals'))
@@ -677,14 +1080,15 @@ def edit_deal(id):
         deal.offer_price = float(request.form.get('offer_price') or 0)
         deal.final_price = float(request.form.get('final_price') or 0) if request.form.get('final_price') else None
         deal.commission_rate = float(request.form.get('commission_rate') or 3.0)
-        deal.closing_date = datetime.strptime(closing_date, '%Y-%m-%d').date() if closing_date else None
+        deal.closing_date = date.fromisoformat(closing_date) if closing_date else None
         deal.notes = request.form.get('notes')
-        db.session.commit()
+        db.session.flush()
         
         if old_status != deal.status:
             log_activity('status_change', 'deal', deal.id, deal.property.title, f'Deal status changed: {old_status} → {deal.status}')
         else:
             log_activity('updated', 'deal', deal.id, deal.property.title, f'Updated deal for {deal.property.title}')
+        db.session.commit()
         flash('Deal updated successfully!', 'success')
         return redirect(url_for('deals'))
     
@@ -701,15 +1105,18 @@ def tasks():
     status_filter = request.args.get('status', '')
     priority_filter = request.args.get('priority', '')
     
-    query = Task.query.filter_by(user_id=current_user.id)
-    
+    conditions = [Task.user_id == current_user.id]
     if status_filter:
-        query = query.filter_by(status=status_filter)
+        conditions.append(Task.status == status_filter)
     if priority_filter:
-        query = query.filter_by(priority=priority_filter)
+        conditions.append(Task.priority == priority_filter)
     
-    tasks = query.order_by(Task.due_date).all()
-    return render_template('tasks.html', tasks=tasks)
+    page = request.args.get('page', 1, type=int)
+    pagination = db.paginate(
+        db.select(Task).where(*conditions).order_by(Task.due_date),
+        page=page, per_page=PER_PAGE, error_out=False
+    )
+    return render_template('tasks.html', tasks=pagination.items, pagination=pagination)
 
 
 @app.route('/tasks/add', methods=['POST'])
@@ -720,12 +1127,13 @@ def add_task():
         title=request.form.get('title'),
         description=request.form.get('description'),
         priority=request.form.get('priority', 'medium'),
-        due_date=datetime.strptime(due_date, '%Y-%m-%dT%H:%M') if due_date else None,
+        due_date=datetime.fromisoformat(due_date) if due_date else None,
         user_id=current_user.id
     )
     db.session.add(task)
-    db.session.commit()
+    db.session.flush()
     log_activity('created', 'task', task.id, task.title, f'Created task: {task.title}')
+    db.session.commit()
     flash('Task added!', 'success')
     return redirect(url_for('tasks'))
 
@@ -733,7 +1141,7 @@ def add_task():
 @app.route('/tasks/<int:id>/toggle', methods=['POST'])
 @login_required
 def toggle_task(id):
-    task = Task.query.get_or_404(id)
+    task = db.get_or_404(Task, id)
     if task.user_id != current_user.id:
         return jsonify({'error': 'Access denied'}), 403
     
@@ -753,85 +1161,107 @@ def toggle_task(id):
 @app.route('/tasks/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_task(id):
-    task = Task.query.get_or_404(id)
+    task = db.get_or_404(Task, id)
     if task.user_id != current_user.id:
         return jsonify({'error': 'Access denied'}), 403
     
     task_title = task.title
     db.session.delete(task)
-    db.session.commit()
     log_activity('deleted', 'task', id, task_title, f'Deleted task: {task_title}')
+    db.session.commit()
     flash('Task deleted!', 'success')
     return redirect(url_for('tasks'))
 
 
 # ============== Reports ==============
 
+MONTH_NAMES = tuple(calendar.month_name[month_number] for month_number in range(1, 13))
+
+
 @app.route('/reports')
 @login_required
 def reports():
+    cached = reports_cache.get(current_user.id)
+    if cached and cached[0] > time.monotonic():
+        return render_template('reports.html', **cached[1])
+    
     # Sales by month
     current_year = datetime.utcnow().year
-    monthly_data = []
-    
-    for month in range(1, 13):
-        start_date = datetime(current_year, month, 1)
-        if month == 12:
-            end_date = datetime(current_year + 1, 1, 1)
-        else:
-            end_date = datetime(current_year, month + 1, 1)
-        
-        deals = Deal.query.join(Client).filter(
+    month = db.func.extract('month', Deal.closing_date)
+    monthly_totals = {
+        int(row.month): row for row in db.session.execute(db.select(
+            month.label('month'),
+            db.func.sum(Deal.sale_price).label('total_sales'),
+            db.func.coalesce(db.func.sum(Deal.commission_amount), 0).label('commission'),
+            db.func.count(Deal.id).label('deals')
+        ).join(Client).where(
             Client.agent_id == current_user.id,
             Deal.status == 'closed',
-            Deal.closing_date >= start_date.date(),
-            Deal.closing_date < end_date.date()
-        ).all()
-        
-        total = sum(deal.final_price or deal.offer_price or 0 for deal in deals)
-        commission = sum(deal.commission_amount for deal in deals)
-        
+            Deal.closing_date >= datetime(current_year, 1, 1).date(),
+            Deal.closing_date < datetime(current_year + 1, 1, 1).date()
+        ).group_by(month))
+    }
+    
+    monthly_data = []
+    for month_number, month_name in enumerate(MONTH_NAMES, 1):
+        row = monthly_totals.get(month_number)
         monthly_data.append({
-            'month': start_date.strftime('%B'),
-            'total_sales': total,
-            'commission': commission,
-            'deals': len(deals)
+            'month': month_name,
+            'total_sales': row.total_sales if row else 0,
+            'commission': row.commission if row else 0,
+            'deals': row.deals if row else 0
         })
     
     # Client sources - convert to list of lists for JSON serialization
-    source_query = db.session.query(
+    source_query = db.session.execute(db.select(
         Client.source,
         db.func.count(Client.id)
-    ).filter(
+    ).where(
         Client.agent_id == current_user.id,
         Client.source.isnot(None)
-    ).group_by(Client.source).all()
+    ).group_by(Client.source)).all()
     source_data = [[row[0], row[1]] for row in source_query]
     
     # Property status - convert to list of lists for JSON serialization
-    property_query = db.session.query(
+    property_query = db.session.execute(db.select(
         Property.status,
         db.func.count(Property.id)
-    ).filter(
+    ).where(
         Property.agent_id == current_user.id
-    ).group_by(Property.status).all()
+    ).group_by(Property.status)).all()
     property_status = [[row[0], row[1]] for row in property_query]
     
-    return render_template('reports.html',
+    context = dict(
         monthly_data=monthly_data,
         source_data=source_data,
         property_status=property_status
     )
+    reports_cache[current_user.id] = (time.monotonic() + REPORTS_CACHE_TTL, context)
+    
+    return render_template('reports.html', **context)
 
 
 # ============== Staff Management Routes (Admin Only) ==============
 
+# Palette for new staff members' avatars
+AVATAR_COLORS = ('#1a365d', '#2c5282', '#2b6cb0', '#38a169', '#d69e2e', '#805ad5', '#e53e3e', '#dd6b20')
+
+
+def has_current_role(check):
+    """Check the current user's role as stored now, not as cached at login"""
+    user = db.session.get(User, current_user.id, populate_existing=True)
+    if user is not None and check(user):
+        return True
+    # This worker's snapshot is stale; reload it on the next request
+    forget_user(current_user.id)
+    return False
+
+
 def admin_required(f):
     """Decorator to require admin role"""
-    from functools import wraps
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or not current_user.is_admin():
+        if not current_user.is_authenticated or not has_current_role(User.is_admin):
             flash('Access denied. Admin privileges required.', 'error')
             return redirect(url_for('dashboard'))
         return f(*args, **kwargs)
@@ -840,10 +1270,9 @@ def admin_required(f):
 
 def manager_required(f):
     """Decorator to require manager or admin role"""
-    from functools import wraps
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or not current_user.is_manager():
+        if not current_user.is_authenticated or not has_current_role(User.is_manager):
             flash('Access denied. Manager privileges required.', 'error')
             return redirect(url_for('dashboard'))
         return f(*args, **kwargs)
@@ -879,27 +1308,51 @@ def staff_list():
             )
         )
     
-    staff = query.order_by(User.created_at.desc()).all()
+    # Overview totals cover every matching staff member, not just the current page
+    role_counts = {}
+    active_count = 0
+    for role, count, active in query.with_entities(
+        User.role,
+        db.func.count(User.id),
+        db.func.coalesce(db.func.sum(db.cast(User.is_active, db.Integer)), 0)
+    ).group_by(User.role):
+        role_counts[role] = count
+        active_count += active
+    
+    page = request.args.get('page', 1, type=int)
+    pagination = query.order_by(User.created_at.desc())\
+        .paginate(page=page, per_page=STAFF_PER_PAGE, error_out=False)
+    staff = pagination.items
+    
+    # Get stats for the staff members on this page with one grouped query per table
+    staff_ids = [member.id for member in staff]
+    clients_count = dict(db.session.execute(db.select(Client.agent_id, db.func.count(Client.id))
+        .where(Client.agent_id.in_(staff_ids)).group_by(Client.agent_id)).all())
+    properties_count = dict(db.session.execute(db.select(Property.agent_id, db.func.count(Property.id))
+        .where(Property.agent_id.in_(staff_ids)).group_by(Property.agent_id)).all())
+    closed_deals = {
+        row.agent_id: row for row in db.session.execute(db.select(
+            Client.agent_id,
+            db.func.count(Deal.id).label('deals'),
+            db.func.coalesce(db.func.sum(Deal.commission_amount), 0).label('commission')
+        ).join(Deal).where(
+            Client.agent_id.in_(staff_ids),
+            Deal.status == 'closed'
+        ).group_by(Client.agent_id))
+    }
     
-    # Get stats for each staff member
     staff_stats = {}
     for member in staff:
-        clients_count = Client.query.filter_by(agent_id=member.id).count()
-        properties_count = Property.query.filter_by(agent_id=member.id).count()
-        closed_deals = Deal.query.join(Client).filter(
-            Client.agent_id == member.id,
-            Deal.status == 'closed'
-        ).all()
-        total_commission = sum(deal.commission_amount for deal in closed_deals)
-        
+        deals = closed_deals.get(member.id)
         staff_stats[member.id] = {
-            'clients': clients_count,
-            'properties': properties_count,
-            'deals': len(closed_deals),
-            'commission': total_commission
+            'clients': clients_count.get(member.id, 0),
+            'properties': properties_count.get(member.id, 0),
+            'deals': deals.deals if deals else 0,
+            'commission': deals.commission if deals else 0
         }
     
-    return render_template('staff/staff_list.html', staff=staff, staff_stats=staff_stats)
+    return render_template('staff/staff_list.html', staff=staff, pagination=pagination, staff_stats=staff_stats,
+                         role_counts=role_counts, active_count=active_count)
 
 
 @app.route('/staff/add', methods=['GET', 'POST'])
@@ -922,10 +1375,6 @@ def add_staff():
         
         hire_date = request.form.get('hire_date')
         
-        # Generate random avatar color
-        import random
-        colors = ['#1a365d', '#2c5282', '#2b6cb0', '#38a169', '#d69e2e', '#805ad5', '#e53e3e', '#dd6b20']
-        
         user = User(
             username=username,
             email=email,
@@ -934,15 +1383,16 @@ def add_staff():
             last_name=request.form.get('last_name'),
             phone=request.form.get('phone'),
             position=request.form.get('position'),
-            hire_date=datetime.strptime(hire_date, '%Y-%m-%d').date() if hire_date else None,
+            hire_date=date.fromisoformat(hire_date) if hire_date else None,
             commission_rate=float(request.form.get('commission_rate') or 3.0),
             is_active=True,
-            avatar_color=random.choice(colors),
+            avatar_color=random.choice(AVATAR_COLORS),
             created_by=current_user.id
         )
         user.set_password(password)
         db.session.add(user)
         db.session.commit()
+        forget_user(user.id)
         
         flash(f'Staff member {user.full_name} created successfully!', 'success')
         return redirect(url_for('staff_list'))
@@ -955,14 +1405,19 @@ def add_staff():
 @admin_required
 def view_staff(id):
     """View staff member details"""
-    member = User.query.get_or_404(id)
+    member = db.get_or_404(User, id)
     
     # Get staff statistics
-    clients = Client.query.filter_by(agent_id=member.id).all()
-    properties = Property.query.filter_by(agent_id=member.id).all()
-    
-    # Get deals
-    deals = Deal.query.join(Client).filter(Client.agent_id == member.id).all()
+    total_clients, total_properties = db.session.execute(db.select(
+        db.select(db.func.count(Client.id)).where(Client.agent_id == member.id).scalar_subquery(),
+        db.select(db.func.count(Property.id)).where(Property.agent_id == member.id).scalar_subquery()
+    )).one()
+    
+    # Get deals (the page lists all of them, so their totals are taken from the list)
+    deals = Deal.query.join(Client).options(
+        db.contains_eager(Deal.client),
+        db.joinedload(Deal.property)
+    ).filter(Client.agent_id == member.id).all()
     closed_deals = [d for d in deals if d.status == 'closed']
     active_deals = [d for d in deals if d.status in ['initiated', 'negotiation', 'under_contract']]
     
@@ -976,8 +1431,8 @@ def view_staff(id):
         .order_by(Property.created_at.desc()).limit(5).all()
     
     stats = {
-        'total_clients': len(clients),
-        'total_properties': len(properties),
+        'total_clients': total_clients,
+        'total_properties': total_properties,
         'total_deals': len(deals),
         'closed_deals': len(closed_deals),
         'active_deals': len(active_deals),
@@ -999,7 +1454,7 @@ def view_staff(id):
 @admin_required
 def edit_staff(id):
     """Edit staff member"""
-    member = User.query.get_or_404(id)
+    member = db.get_or_404(User, id)
     
     if request.method == 'POST':
         # Check for duplicate username/email
@@ -1022,7 +1477,7 @@ def edit_staff(id):
         member.last_name = request.form.get('last_name')
         member.phone = request.form.get('phone')
         member.position = request.form.get('position')
-        member.hire_date = datetime.strptime(hire_date, '%Y-%m-%d').date() if hire_date else None
+        member.hire_date = date.fromisoformat(hire_date) if hire_date else None
         member.commission_rate = float(request.form.get('commission_rate') or 3.0)
         member.is_active = request.form.get('is_active') == 'on'
         
@@ -1032,6 +1487,7 @@ def edit_staff(id):
             member.set_password(new_password)
         
         db.session.commit()
+        forget_user(member.id)
         flash('Staff member updated successfully!', 'success')
         return redirect(url_for('view_staff', id=id))
     
@@ -1043,9 +1499,10 @@ def edit_staff(id):
 @admin_required
 def toggle_staff_status(id):
     """Toggle staff active/inactive status"""
-    member = User.query.get_or_404(id)
+    member = db.get_or_404(User, id)
     member.is_active = not member.is_active
     db.session.commit()
+    forget_user(member.id)
     
     status = 'activated' if member.is_active else 'deactivated'
     flash(f'Staff member {member.full_name} has been {status}.', 'success')
@@ -1057,22 +1514,25 @@ def toggle_staff_status(id):
 @admin_required
 def delete_staff(id):
     """Delete staff member"""
-    member = User.query.get_or_404(id)
+    member = db.get_or_404(User, id)
     
     if member.id == current_user.id:
         flash('You cannot delete your own account.', 'error')
         return redirect(url_for('staff_list'))
     
     # Check if staff has any data
-    has_clients = Client.query.filter_by(agent_id=member.id).first()
-    has_properties = Property.query.filter_by(agent_id=member.id).first()
+    has_data = db.session.execute(db.select(db.or_(
+        db.exists().where(Client.agent_id == member.id),
+        db.exists().where(Property.agent_id == member.id)
+    ))).scalar()
     
-    if has_clients or has_properties:
+    if has_data:
         flash('Cannot delete staff member with assigned clients or properties. Deactivate instead.', 'error')
         return redirect(url_for('view_staff', id=id))
     
     db.session.delete(member)
     db.session.commit()
+    forget_user(id)
     flash('Staff member deleted successfully!', 'success')
     return redirect(url_for('staff_list'))
 
@@ -1082,7 +1542,7 @@ def delete_staff(id):
 @admin_required
 def reset_staff_password(id):
     """Reset staff member password"""
-    member = User.query.get_or_404(id)
+    member = db.get_or_404(User, id)
     new_password = request.form.get('new_password')
     
     if not new_password or len(new_password) < 6:
@@ -1091,6 +1551,7 @@ def reset_staff_password(id):
     
     member.set_password(new_password)
     db.session.commit()
+    forget_user(member.id)
     flash(f'Password for {member.full_name} has been reset.', 'success')
     return redirect(url_for('view_staff', id=id))
 
@@ -1121,22 +1582,30 @@ def profile():
                 flash('Current password is incorrect.', 'error')
         
         db.session.commit()
+        forget_user(current_user.id)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile'))
     
-    # Get user statistics
-    clients_count = Client.query.filter_by(agent_id=current_user.id).count()
-    properties_count = Property.query.filter_by(agent_id=current_user.id).count()
-    closed_deals = Deal.query.join(Client).filter(
-        Client.agent_id == current_user.id,
-        Deal.status == 'closed'
-    ).all()
-    total_commission = sum(deal.commission_amount for deal in closed_deals)
+    # Get user statistics in a single round-trip
+    clients_count, properties_count, closed_count, total_commission = db.session.execute(db.select(
+        db.select(db.func.count(Client.id))
+            .where(Client.agent_id == current_user.id).scalar_subquery(),
+        db.select(db.func.count(Property.id))
+            .where(Property.agent_id == current_user.id).scalar_subquery(),
+        db.select(db.func.count(Deal.id)).join(Client).where(
+            Client.agent_id == current_user.id,
+            Deal.status == 'closed'
+        ).scalar_subquery(),
+        db.select(db.func.coalesce(db.func.sum(Deal.commission_amount), 0)).join(Client).where(
+            Client.agent_id == current_user.id,
+            Deal.status == 'closed'
+        ).scalar_subquery()
+    )).one()
     
     stats = {
         'clients': clients_count,
         'properties': properties_count,
-        'deals': len(closed_deals),
+        'deals': closed_count,
         'commission': total_commission
     }
     
@@ -1145,6 +1614,19 @@ def profile():
 
 # ============== Activity Log Routes (Admin Only) ==============
 
+def staff_options():
+    """Id and full name of every user, cached for STAFF_OPTIONS_TTL"""
+    cached = staff_options_cache.get('all')
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    options = db.session.execute(
+        db.select(User.id, User.full_name.label('full_name'))
+    ).all()
+    staff_options_cache['all'] = (time.monotonic() + STAFF_OPTIONS_TTL, options)
+    return options
+
+
 @app.route('/activity-log')
 @login_required
 @admin_required
@@ -1164,31 +1646,44 @@ def activity_log():
     if entity_filter:
         query = query.filter_by(entity_type=entity_filter)
     if date_filter:
-        filter_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
-        query = query.filter(db.func.date(Activity.created_at) == filter_date)
+        day_start = datetime.combine(date.fromisoformat(date_filter), datetime.min.time())
+        query = query.filter(
+            Activity.created_at >= day_start,
+            Activity.created_at < day_start + timedelta(days=1)
+        )
     
-    activities = query.order_by(Activity.created_at.desc()).limit(500).all()
+    page = request.args.get('page', 1, type=int)
+    pagination = query.options(db.joinedload(Activity.user))\
+        .order_by(Activity.created_at.desc())\
+        .paginate(page=page, per_page=PER_PAGE, error_out=False)
+    activities = pagination.items
     
     # Get all staff for filter dropdown
-    staff = User.query.filter(User.id != current_user.id).all()
+    staff = [member for member in staff_options() if member.id != current_user.id]
     
-    # Get activity stats
+    # Get activity stats in a single round-trip
     today = datetime.utcnow().date()
-    today_count = Activity.query.filter(db.func.date(Activity.created_at) == today).count()
-    
     week_start = today - timedelta(days=today.weekday())
-    week_count = Activity.query.filter(Activity.created_at >= datetime.combine(week_start, datetime.min.time())).count()
+    today_count, week_count = db.session.execute(db.select(
+        db.select(db.func.count(Activity.id)).where(
+            Activity.created_at >= datetime.combine(today, datetime.min.time())
+        ).scalar_subquery(),
+        db.select(db.func.count(Activity.id)).where(
+            Activity.created_at >= datetime.combine(week_start, datetime.min.time())
+        ).scalar_subquery()
+    )).one()
     
     # Most active staff this week
-    most_active = db.session.query(
+    most_active = db.session.execute(db.select(
         User.id, User.first_name, User.last_name, User.username,
         db.func.count(Activity.id).label('activity_count')
-    ).join(Activity).filter(
+    ).join(Activity).where(
         Activity.created_at >= datetime.combine(week_start, datetime.min.time())
-    ).group_by(User.id).order_by(db.desc('activity_count')).limit(5).all()
+    ).group_by(User.id).order_by(db.desc('activity_count')).limit(5)).all()
     
     return render_template('activity_log.html', 
         activities=activities, 
+        pagination=pagination,
         staff=staff,
         today_count=today_count,
         week_count=week_count,
@@ -1201,24 +1696,26 @@ def activity_log():
 @admin_required
 def user_activity_log(user_id):
     """View activities for a specific user"""
-    user = User.query.get_or_404(user_id)
+    user = db.get_or_404(User, user_id)
     activities = Activity.query.filter_by(user_id=user_id)\
         .order_by(Activity.created_at.desc()).limit(200).all()
     
-    # Activity stats for this user
+    # Activity stats for this user in a single round-trip
     today = datetime.utcnow().date()
-    today_count = Activity.query.filter(
-        Activity.user_id == user_id,
-        db.func.date(Activity.created_at) == today
-    ).count()
-    
     week_start = today - timedelta(days=today.weekday())
-    week_count = Activity.query.filter(
-        Activity.user_id == user_id,
-        Activity.created_at >= datetime.combine(week_start, datetime.min.time())
-    ).count()
-    
-    total_count = Activity.query.filter_by(user_id=user_id).count()
+    today_count, week_count, total_count = db.session.execute(db.select(
+        db.select(db.func.count(Activity.id)).where(
+            Activity.user_id == user_id,
+            Activity.created_at >= datetime.combine(today, datetime.min.time())
+        ).scalar_subquery(),
+        db.select(db.func.count(Activity.id)).where(
+            Activity.user_id == user_id,
+            Activity.created_at >= datetime.combine(week_start, datetime.min.time())
+        ).scalar_subquery(),
+        db.select(db.func.count(Activity.id)).where(
+            Activity.user_id == user_id
+        ).scalar_subquery()
+    )).one()
     
     return render_template('user_activity_log.html', 
         user=user, 
@@ -1234,6 +1731,11 @@ def user_activity_log(user_id):
 def init_db():
     with app.app_context():
         db.create_all()
+        # create_all() skips existing tables, so add any indexes missing from older databases
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+        create_fts_tables()
         # Create admin user if none exists
         if not User.query.filter_by(role='admin').first():
             admin_user = User(